@@ -8,146 +8,434 @@ import os
 import re
 import json
 import time
+import hashlib
+import functools
+import contextlib
+import sqlite3
 import argparse
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import urllib.parse
-import urllib.request
-import urllib.error
 from urllib.parse import urlencode
 import xml.etree.ElementTree as ET
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rapidfuzz import fuzz, process
 import bibtexparser
+from rate_limiter import TokenBucket, request_with_backoff
+from log_config import setup_logging
 from bibtexparser.bparser import BibTexParser
 from bibtexparser.bwriter import BibTexWriter
-from bibtexparser.bibdatabase import BibDatabase
 
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bib_validation.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+setup_logging('bib_validation.log')
 logger = logging.getLogger(__name__)
 
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_WS_RE = re.compile(r'\s+')
+_DOI_RE = re.compile(r'^10\.\d{4,9}/\S+$')
+
+@functools.lru_cache(maxsize=8192)
+def _normalize_text(text: str) -> str:
+    """去除标点并转为小写（每个唯一字符串只计算一次）"""
+    return _PUNCT_RE.sub('', text.lower())
+
+@functools.lru_cache(maxsize=8192)
+def _similarity(text1: str, text2: str) -> float:
+    """计算规范化文本的相似度，调用方需保证参数有序以合并对称查询"""
+    return fuzz.ratio(text1, text2)
+
+# Crossref polite pool（带mailto的User-Agent）允许的请求速率
+CROSSREF_RATE_LIMIT = 50
+POLITE_DELAY = 1.0 / CROSSREF_RATE_LIMIT
+# 未提供mailto时使用保守的请求间隔
+DEFAULT_DELAY = 1.0
+
+CROSSREF_WORKS_URL = 'https://api.crossref.org/works'
+
+# 每次搜索取回的候选文献数
+SEARCH_ROWS = 5
+# 候选标题得分与最高分相差不超过该值时保留Crossref的排序
+CANDIDATE_SCORE_MARGIN = 5
+
+DEFAULT_CACHE_FILE = 'crossref_cache.sqlite'
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+
+class QueryCache:
+    """基于SQLite的Crossref查询结果缓存"""
+    
+    def __init__(self, cache_file: str = DEFAULT_CACHE_FILE, ttl: int = DEFAULT_CACHE_TTL):
+        """
+        初始化缓存
+        
+        Args:
+            cache_file: SQLite缓存文件路径
+            ttl: 缓存有效期（秒），0表示永不过期
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS crossref_cache '
+            '(query_hash TEXT PRIMARY KEY, ts INTEGER, payload TEXT)'
+        )
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(query: str) -> str:
+        """对规范化后的查询计算缓存键"""
+        normalized = ' '.join(query.lower().split())
+        return hashlib.blake2b(normalized.encode('utf-8')).hexdigest()
+    
+    def get(self, query: str) -> Optional[Dict]:
+        """读取缓存，未命中或已过期时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT ts, payload FROM crossref_cache WHERE query_hash = ?',
+                (self.make_key(query),)
+            ).fetchone()
+        if not row:
+            return None
+        ts, payload = row
+        if self.ttl and time.time() - ts > self.ttl:
+            return None
+        return json.loads(payload)
+    
+    def put(self, query: str, result: Dict):
+        """写入缓存"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO crossref_cache (query_hash, ts, payload) VALUES (?, ?, ?)',
+                (self.make_key(query), int(time.time()), json.dumps(result, ensure_ascii=False))
+            )
+            self._conn.commit()
+
 class BibValidator:
-    def __init__(self, proxy_url: Optional[str] = None, delay: float = 1.0):
+    def __init__(self, proxy_url: Optional[str] = None, delay: Optional[float] = None, workers: int = 1,
+                 batch_size: int = 50, cache_file: Optional[str] = DEFAULT_CACHE_FILE,
+                 cache_ttl: int = DEFAULT_CACHE_TTL, mailto: Optional[str] = None):
         """
         初始化验证器
         
         Args:
             proxy_url: proxy URL (例如: http://127.0.0.1:8080)
-            delay: 请求之间的延迟时间（秒）
+            delay: 请求之间的平均间隔（秒），即限流速率的倒数；默认提供mailto时为POLITE_DELAY，否则为DEFAULT_DELAY
+            workers: 并发验证的线程数
+            batch_size: 每批搜索的条目数
+            cache_file: 查询缓存文件路径，None表示禁用缓存
+            cache_ttl: 缓存有效期（秒）
+            mailto: 联系邮箱，附加在User-Agent中以进入Crossref polite pool
         """
+        if delay is None:
+            delay = POLITE_DELAY if mailto else DEFAULT_DELAY
         self.delay = delay
-        self.proxy_handler = None
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.cache = QueryCache(cache_file, cache_ttl) if cache_file else None
+        
+        # 复用连接池，避免每个请求重新建立TCP+TLS连接
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.workers,
+            pool_maxsize=self.workers,
+            # 只重试连接错误，429由request_with_backoff通过共享令牌桶统一退避
+            max_retries=Retry(total=3, backoff_factor=0.3, respect_retry_after_header=False)
+        )
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.headers.update({
+            'User-Agent': f'BibValidator/1.0 (mailto:{mailto})' if mailto else 'BibValidator/1.0',
+            'Accept': 'application/json'
+        })
+        
+        # 所有线程共享的令牌桶，保证并发时总请求速率不超过Crossref限制
+        rate = min(1.0 / delay, CROSSREF_RATE_LIMIT) if delay > 0 else CROSSREF_RATE_LIMIT
+        self._bucket = TokenBucket(rate)
         
         if proxy_url:
             self._setup_proxy(proxy_url)
     
     def _setup_proxy(self, proxy_url: str):
         """设置proxy"""
-        proxy_handler = urllib.request.ProxyHandler({
+        self._session.proxies = {
             'http': proxy_url,
             'https': proxy_url
-        })
-        opener = urllib.request.build_opener(proxy_handler)
-        urllib.request.install_opener(opener)
-        self.proxy_handler = proxy_handler
-        logger.info(f"已设置proxy: {proxy_url}")
+        }
+        logger.info("已设置proxy: %s", proxy_url)
     
-    def search_google_scholar(self, query: str) -> Optional[Dict]:
+    def _crossref_get(self, url: str, max_attempts: int = 3) -> Dict:
+        """
+        限流后请求Crossref，遇到429时按Retry-After暂停令牌桶再重试
+        
+        Args:
+            url: 请求URL
+            max_attempts: 最大尝试次数
+            
+        Returns:
+            解析后的JSON响应
+        """
+        response = request_with_backoff(
+            self._bucket,
+            lambda: self._session.get(url, timeout=30),
+            name='Crossref',
+            max_attempts=max_attempts
+        )
+        response.raise_for_status()
+        return response.json()
+    
+    def search_google_scholar(self, query: str, title: Optional[str] = None) -> Optional[Dict]:
         """
         搜索谷歌学术（模拟API调用）
         注意：由于谷歌学术没有公开API，这里使用模拟搜索
         
         Args:
             query: 搜索查询
+            title: 条目标题，用于从多个候选中选出最佳匹配（可选）
             
         Returns:
             搜索结果字典或None
         """
+        if self.cache:
+            cached = self.cache.get(query)
+            if cached is not None:
+                logger.info("缓存命中: %s", query)
+                return cached
+        
         try:
-            # 模拟谷歌学术搜索
-            encoded_query = urllib.parse.quote(query)
-            
             # 这里使用Crossref API作为替代方案，因为谷歌学术没有公开API
-            url = f"https://api.crossref.org/works?query={encoded_query}&rows=1"
+            # query.bibliographic专用于引用匹配（标题、作者、年份等），比自由文本query更准确
+            url = f"{CROSSREF_WORKS_URL}?{urlencode({'query.bibliographic': query, 'rows': SEARCH_ROWS})}"
             
-            logger.info(f"搜索: {query}")
+            logger.info("搜索: %s", query)
             
-            # 添加延迟避免请求过快
-            time.sleep(self.delay)
-            
-            request = urllib.request.Request(
-                url,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    'Accept': 'application/json'
-                }
-            )
+            data = self._crossref_get(url)
             
-            with urllib.request.urlopen(request, timeout=30) as response:
-                data = json.loads(response.read().decode('utf-8'))
-                
-                if data['message']['items']:
-                    item = data['message']['items'][0]
-                    return {
-                        'title': item.get('title', [''])[0],
-                        'authors': [author.get('given', '') + ' ' + author.get('family', '') 
-                                   for author in item.get('author', [])],
-                        'journal': item.get('container-title', [''])[0],
-                        'year': item.get('published-print', {}).get('date-parts', [[None]])[0][0],
-                        'volume': item.get('volume'),
-                        'issue': item.get('issue'),
-                        'pages': item.get('page'),
-                        'doi': item.get('DOI'),
-                        'url': item.get('URL')
-                    }
+            if data['message']['items']:
+                result = self._pick_best_candidate(title, data['message']['items'])
+                result['source'] = 'search'
+                if self.cache:
+                    self.cache.put(query, result)
+                return result
             
             return None
-            
+        
         except Exception as e:
-            logger.warning(f"搜索失败: {e}")
+            logger.warning("搜索失败: %s", e)
             return None
     
+    def search_by_dois(self, dois: List[str]) -> Dict[str, Dict]:
+        """
+        通过一次Crossref请求批量查询多个DOI
+        
+        Args:
+            dois: DOI列表（已规范化为小写）
+        
+        Returns:
+            小写DOI到搜索结果字典的映射
+        """
+        # DOI记录按DOI本身缓存，修改条目的DOI后会重新查询
+        found: Dict[str, Dict] = {}
+        if self.cache:
+            for doi in dois:
+                cached = self.cache.get(f"doi:{doi}")
+                if cached is not None:
+                    found[doi] = cached
+            dois = [doi for doi in dois if doi not in found]
+            if not dois:
+                return found
+        
+        try:
+            if len(dois) == 1:
+                # 单个DOI直接访问works/{doi}，无需经过搜索排序
+                logger.info("查询DOI: %s", dois[0])
+                data = self._crossref_get(f"{CROSSREF_WORKS_URL}/{urllib.parse.quote(dois[0])}")
+                items = [data['message']]
+            else:
+                doi_filter = ','.join(f"doi:{doi}" for doi in dois)
+                url = f"{CROSSREF_WORKS_URL}?{urlencode({'filter': doi_filter, 'rows': len(dois)})}"
+                logger.info("批量查询DOI: %s 个", len(dois))
+                items = self._crossref_get(url)['message']['items']
+            
+            for item in items:
+                if not item.get('DOI'):
+                    continue
+                # 标记来源：DOI解析得到的记录必然带有条目自身的DOI，不能据此判定条目正确
+                result = dict(self._parse_crossref_item(item), source='doi')
+                found[item['DOI'].lower()] = result
+                if self.cache:
+                    self.cache.put(f"doi:{item['DOI'].lower()}", result)
+        
+        except Exception as e:
+            logger.warning("批量查询DOI失败: %s", e)
+        
+        return found
+    
+    def search_many(self, queries: List[str], dois: Optional[List[Optional[str]]] = None,
+                    executor: Optional[ThreadPoolExecutor] = None,
+                    titles: Optional[List[Optional[str]]] = None) -> List[Optional[Dict]]:
+        """
+        批量搜索：已知DOI的条目合并为一次filter请求，其余查询并发发出
+        
+        Args:
+            queries: 搜索查询列表
+            dois: 与queries对应的DOI列表（可选，缺失处为None）
+            executor: 复用的线程池（可选），未提供时临时创建
+            titles: 与queries对应的条目标题列表（可选），用于挑选文本搜索的候选
+        
+        Returns:
+            与queries顺序一致的搜索结果列表
+        """
+        dois = dois or [None] * len(queries)
+        titles = titles or [None] * len(queries)
+        results: List[Optional[Dict]] = [None] * len(queries)
+        
+        # 只有格式正确的DOI才走DOI查询，避免一个错误的DOI导致整个filter请求失败
+        # （DOI记录和文本搜索结果分别按DOI和查询文本缓存）
+        known = [(i, doi.strip().lower()) for i, doi in enumerate(dois)
+                 if doi and _DOI_RE.match(doi.strip())]
+        if known:
+            found = self.search_by_dois(list(dict.fromkeys(doi for _, doi in known)))
+            hits = 0
+            for i, doi in known:
+                result = found.get(doi)
+                if result and self._doi_record_usable(result, titles[i]):
+                    results[i] = result
+                    hits += 1
+            logger.info("DOI命中: %s/%s", hits, len(known))
+        
+        # DOI未命中、缺失或格式错误的条目回退到文本搜索
+        pending = [i for i in range(len(queries)) if results[i] is None]
+        if pending:
+            own_executor = executor is None
+            if own_executor:
+                executor = ThreadPoolExecutor(max_workers=self.workers)
+            try:
+                for i, result in zip(pending, executor.map(self.search_google_scholar,
+                                                           [queries[i] for i in pending],
+                                                           [titles[i] for i in pending])):
+                    results[i] = result
+            finally:
+                if own_executor:
+                    executor.shutdown()
+        
+        return results
+    
+    def _doi_record_usable(self, record: Dict, title: Optional[str]) -> bool:
+        """
+        判断DOI解析得到的记录能否直接用于验证
+        缺少标题、作者或年份，或标题与条目明显不符（DOI可能写错）时应回退到文本搜索
+        
+        Args:
+            record: DOI解析得到的搜索结果字典
+            title: 条目标题
+            
+        Returns:
+            记录是否可用
+        """
+        if not (record['title'] and record['authors'] and record['year']):
+            return False
+        if title and not self._normalized_match(_normalize_text(title), _normalize_text(record['title'])):
+            logger.info("DOI记录标题不符，回退到文本搜索: %s", record['doi'])
+            return False
+        return True
+    
+    def _pick_best_candidate(self, title: Optional[str], items: List[Dict]) -> Dict:
+        """
+        从多个Crossref候选中选出标题与条目标题最相似的一个
+        （得分接近时保留Crossref的排序，未提供标题时直接取第一个候选）
+        
+        Args:
+            title: 条目标题
+            items: Crossref返回的候选记录
+            
+        Returns:
+            最佳候选的搜索结果字典
+        """
+        candidates = [self._parse_crossref_item(item) for item in items]
+        if len(candidates) == 1 or not title:
+            return candidates[0]
+        
+        # 一次原生调用为所有候选打分，结果按得分降序排列
+        matches = process.extract(title, [c['title'] for c in candidates], scorer=fuzz.token_sort_ratio,
+                                  processor=_normalize_text, limit=None)
+        threshold = matches[0][1] - CANDIDATE_SCORE_MARGIN
+        return candidates[min(index for _, score, index in matches if score >= threshold)]
+    
+    def _parse_crossref_item(self, item: Dict) -> Dict:
+        """将Crossref返回的work记录转换为搜索结果字典（Crossref可能返回空列表字段）"""
+        date_parts = (item.get('published-print') or {}).get('date-parts') or [[None]]
+        return {
+            'title': (item.get('title') or [''])[0],
+            'authors': [author.get('given', '') + ' ' + author.get('family', '')
+                       for author in item.get('author', [])],
+            'journal': (item.get('container-title') or [''])[0],
+            'year': (date_parts[0] or [None])[0],
+            'volume': item.get('volume'),
+            'issue': item.get('issue'),
+            'pages': item.get('page'),
+            'doi': item.get('DOI'),
+            'url': item.get('URL')
+        }
+    
+    def _build_search_query(self, entry: Dict) -> str:
+        """构建条目的搜索查询"""
+        return f"{entry.get('title', '')} {entry.get('author', '')} {entry.get('journal', '')} {entry.get('year', '')}"
+    
     def validate_bib_entry(self, entry: Dict) -> Tuple[bool, Dict, str]:
         """
         验证单个bib条目
         
         Args:
             entry: bib条目字典
-            
+        
+        Returns:
+            (是否有效, 修正后的条目, 验证信息)
+        """
+        logger.info("验证条目: %s", entry.get('ID', 'unknown'))
+        
+        # 搜索验证（有DOI时优先直接查询DOI）
+        search_result = self.search_many([self._build_search_query(entry)], [entry.get('doi')],
+                                         titles=[entry.get('title')])[0]
+        
+        return self._compare_entry(entry, search_result)
+    
+    def _compare_entry(self, entry: Dict, search_result: Optional[Dict]) -> Tuple[bool, Dict, str]:
+        """
+        将bib条目与搜索结果比较并生成修正
+        
+        Args:
+            entry: bib条目字典
+            search_result: 搜索结果字典或None
+        
         Returns:
             (是否有效, 修正后的条目, 验证信息)
         """
-        entry_id = entry.get('ID', 'unknown')
         title = entry.get('title', '')
         authors = entry.get('author', '')
         journal = entry.get('journal', '')
         year = entry.get('year', '')
         
-        logger.info(f"验证条目: {entry_id}")
-        
-        # 构建搜索查询
-        search_query = f"{title} {authors} {journal} {year}"
-        
-        # 搜索验证
-        search_result = self.search_google_scholar(search_query)
-        
         if not search_result:
             return False, entry, "未找到匹配的文献"
         
+        # DOI是文献的唯一标识，独立的文本搜索找到同一DOI时直接视为验证通过
+        # （通过DOI直接解析的记录必然带有条目自身的DOI，仍需逐字段比较）
+        doi = entry.get('doi', '')
+        if (search_result.get('source') == 'search' and doi and search_result['doi']
+                and doi.strip().lower() == search_result['doi'].lower()):
+            return True, entry, "验证通过"
+        
         # 比较和修正
         corrections = {}
         validation_notes = []
         
-        # 检查标题
+        # 检查标题（_normalized_match先做相等比较，不一致时才计算模糊相似度）
         if title and search_result['title']:
-            if not self._fuzzy_match(title, search_result['title']):
+            if not self._normalized_match(_normalize_text(title), _normalize_text(search_result['title'])):
                 corrections['title'] = search_result['title']
                 validation_notes.append(f"标题不匹配: '{title}' -> '{search_result['title']}'")
         
@@ -160,7 +448,7 @@ class BibValidator:
         
         # 检查期刊
         if journal and search_result['journal']:
-            if not self._fuzzy_match(journal, search_result['journal']):
+            if not self._normalized_match(_normalize_text(journal), _normalize_text(search_result['journal'])):
                 corrections['journal'] = search_result['journal']
                 validation_notes.append(f"期刊名称更新: '{journal}' -> '{search_result['journal']}'")
         
@@ -199,19 +487,27 @@ class BibValidator:
         else:
             return True, entry, "验证通过"
     
-    def _fuzzy_match(self, text1: str, text2: str, threshold: float = 0.8) -> bool:
-        """模糊匹配文本"""
-        import difflib
-        text1_clean = re.sub(r'[^\w\s]', '', text1.lower())
-        text2_clean = re.sub(r'[^\w\s]', '', text2.lower())
-        similarity = difflib.SequenceMatcher(None, text1_clean, text2_clean).ratio()
-        return similarity >= threshold
+    def _normalized_match(self, text1_clean: str, text2_clean: str, threshold: float = 0.8) -> bool:
+        """对已规范化的文本进行模糊匹配"""
+        # 规范化后完全相同则无需计算相似度
+        if text1_clean == text2_clean:
+            return True
+        
+        # ratio上界为 2*min(len)/(len1+len2)，长度相差过大时不可能达到阈值
+        total_len = len(text1_clean) + len(text2_clean)
+        if 2 * min(len(text1_clean), len(text2_clean)) < threshold * total_len:
+            return False
+        
+        return _similarity(*sorted((text1_clean, text2_clean))) >= threshold * 100
     
     def _author_match(self, authors1: str, authors2: str) -> bool:
         """比较作者列表"""
         def normalize_authors(authors_str):
             authors = [a.strip() for a in authors_str.split(' and ')]
-            return sorted([re.sub(r'\s+', ' ', a) for a in authors])
+            return sorted([_WS_RE.sub(' ', a) for a in authors])
+        
+        if authors1 == authors2:
+            return True
         
         try:
             norm1 = normalize_authors(authors1)
@@ -220,13 +516,15 @@ class BibValidator:
         except:
             return False
     
-    def process_bib_file(self, input_file: str, output_file: Optional[str] = None) -> Dict:
+    def process_bib_file(self, input_file: str, output_file: Optional[str] = None,
+                         resume: bool = False) -> Dict:
         """
-        处理整个bib文件
+        处理整个bib文件，每批条目验证完成后立即写入输出文件
         
         Args:
             input_file: 输入bib文件路径
             output_file: 输出bib文件路径（可选）
+            resume: 是否从已有输出文件继续，跳过其中已写入的条目
             
         Returns:
             处理结果统计
@@ -234,19 +532,16 @@ class BibValidator:
         if not os.path.exists(input_file):
             raise FileNotFoundError(f"文件不存在: {input_file}")
         
-        # 读取bib文件
-        with open(input_file, 'r', encoding='utf-8') as f:
-            bib_content = f.read()
-        
-        # 解析bib文件
+        # 解析bib文件（直接从文件对象读取，不在整个处理过程中保留原始文本）
         parser = BibTexParser()
         parser.ignore_nonstandard_types = False
         parser.homogenize_fields = True
         
         try:
-            bib_database = bibtexparser.loads(bib_content, parser=parser)
+            with open(input_file, 'r', encoding='utf-8') as f:
+                bib_database = bibtexparser.load(f, parser=parser)
         except Exception as e:
-            logger.error(f"解析bib文件失败: {e}")
+            logger.error("解析bib文件失败: %s", e)
             raise
         
         results = {
@@ -254,54 +549,147 @@ class BibValidator:
             'valid_entries': 0,
             'corrected_entries': 0,
             'invalid_entries': 0,
+            'resumed_entries': 0,
             'corrections': []
         }
         
-        corrected_entries = []
-        
-        # 验证每个条目
-        for entry in bib_database.entries:
-            is_valid, corrected_entry, message = self.validate_bib_entry(entry)
+        # 续跑时跳过输出文件中已写入的条目
+        entries = bib_database.entries
+        written_ids = self._load_written_ids(output_file) if resume and output_file else None
+        resume = written_ids is not None
+        if resume:
+            entries = [entry for entry in entries if entry['ID'] not in written_ids]
+            results['resumed_entries'] = results['total_entries'] - len(entries)
+            logger.info("续跑: 跳过 %s 个已写入的条目", results['resumed_entries'])
+        
+        # 第一遍：收集所有条目的查询
+        queries = [self._build_search_query(entry) for entry in entries]
+        dois = [entry.get('doi') for entry in entries]
+        titles = [entry.get('title') for entry in entries]
+        
+        keys = [self._dedup_key(entry) for entry in entries]
+        
+        writer = self._create_writer()
+        
+        # 相同文献（标题、第一作者、年份一致）只搜索一次，结果共享给所有重复条目
+        searched: Dict[Tuple, Optional[Dict]] = {}
+        
+        # 第二遍：分批搜索、比较并写入（整个运行期间复用同一个线程池和连接池）
+        with contextlib.ExitStack() as stack:
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=self.workers))
+            out = None
+            if output_file:
+                out = stack.enter_context(open(output_file, 'a' if resume else 'w', encoding='utf-8'))
+            need_separator = resume and out.tell() > 0
             
-            if is_valid:
-                results['valid_entries'] += 1
-                corrected_entries.append(entry)
-                logger.info(f"✓ {entry['ID']}: {message}")
-            else:
-                if message.startswith("需要修正"):
-                    results['corrected_entries'] += 1
-                    corrected_entries.append(corrected_entry)
-                    logger.info(f"⚠ {entry['ID']}: {message}")
-                else:
-                    results['invalid_entries'] += 1
-                    corrected_entries.append(entry)  # 保留原始条目
-                    logger.warning(f"✗ {entry['ID']}: {message}")
-            
-            results['corrections'].append({
-                'id': entry['ID'],
-                'valid': is_valid,
-                'message': message,
-                'corrections': corrected_entry if not is_valid else {}
-            })
-        
-        # 保存修正后的文件
+            for start in range(0, len(entries), self.batch_size):
+                end = start + self.batch_size
+                logger.info("搜索批次: 条目 %s-%s/%s", start + 1, min(end, len(entries)), len(entries))
+                unique = {}
+                for i in range(start, min(end, len(entries))):
+                    if keys[i] not in searched and keys[i] not in unique:
+                        unique[keys[i]] = i
+                if unique:
+                    found = self.search_many([queries[i] for i in unique.values()],
+                                             [dois[i] for i in unique.values()], executor,
+                                             titles=[titles[i] for i in unique.values()])
+                    searched.update(zip(unique.keys(), found))
+                search_results = [searched[key] for key in keys[start:end]]
+                
+                for entry, search_result in zip(entries[start:end], search_results):
+                    output_entry = self._record_validation(entry, search_result, results)
+                    if out:
+                        if need_separator:
+                            out.write(writer.entry_separator)
+                        out.write(writer._entry_to_bibtex(output_entry))
+                        need_separator = True
+                
+                # 每批写完后落盘，中断后可用--resume继续
+                if out:
+                    out.flush()
+        
         if output_file:
-            self._save_corrected_bib(corrected_entries, output_file)
-            logger.info(f"修正后的文件已保存: {output_file}")
+            logger.info("修正后的文件已保存: %s", output_file)
         
         return results
     
-    def _save_corrected_bib(self, entries: List[Dict], output_file: str):
-        """保存修正后的bib文件"""
-        db = BibDatabase()
-        db.entries = entries
+    def _dedup_key(self, entry: Dict) -> Tuple:
+        """
+        计算用于合并重复搜索的键：(DOI, 规范化标题, 第一作者姓氏, 年份)
+        
+        Args:
+            entry: bib条目字典
+            
+        Returns:
+            去重键，没有标题的条目使用其ID以避免被错误合并
+        """
+        title = _normalize_text(entry.get('title', '')).strip()
+        if not title:
+            return ('id', entry.get('ID', ''))
+        
+        first_author = entry.get('author', '').split(' and ')[0].strip()
+        surname = first_author.split(',')[0] if ',' in first_author else first_author.rsplit(' ', 1)[-1]
+        return (entry.get('doi', '').strip().lower(), _WS_RE.sub(' ', title),
+                _normalize_text(surname).strip(), str(entry.get('year', '')).strip())
+    
+    def _record_validation(self, entry: Dict, search_result: Optional[Dict], results: Dict) -> Dict:
+        """
+        比较单个条目并把结果记入统计
+        
+        Args:
+            entry: bib条目字典
+            search_result: 搜索结果字典或None
+            results: 处理结果统计
+            
+        Returns:
+            应写入输出文件的条目
+        """
+        logger.info("验证条目: %s", entry.get('ID', 'unknown'))
+        is_valid, corrected_entry, message = self._compare_entry(entry, search_result)
+        
+        if is_valid:
+            results['valid_entries'] += 1
+            output_entry = entry
+            logger.info("✓ %s: %s", entry['ID'], message)
+        else:
+            if message.startswith("需要修正"):
+                results['corrected_entries'] += 1
+                output_entry = corrected_entry
+                logger.info("⚠ %s: %s", entry['ID'], message)
+            else:
+                results['invalid_entries'] += 1
+                output_entry = entry  # 保留原始条目
+                logger.warning("✗ %s: %s", entry['ID'], message)
+        
+        results['corrections'].append({
+            'id': entry['ID'],
+            'valid': is_valid,
+            'message': message,
+            'corrections': corrected_entry if not is_valid else {}
+        })
+        
+        return output_entry
+    
+    def _load_written_ids(self, output_file: str) -> Optional[set]:
+        """读取已有输出文件中的条目ID，文件不存在或无法解析时返回None（重新处理所有条目）"""
+        if not os.path.exists(output_file):
+            return None
         
+        parser = BibTexParser()
+        parser.ignore_nonstandard_types = False
+        try:
+            with open(output_file, 'r', encoding='utf-8') as f:
+                return {entry['ID'] for entry in bibtexparser.load(f, parser=parser).entries}
+        except Exception as e:
+            logger.warning("读取已有输出文件失败，将重新处理所有条目: %s", e)
+            return None
+    
+    def _create_writer(self) -> BibTexWriter:
+        """创建输出使用的BibTexWriter"""
         writer = BibTexWriter()
         writer.indent = '  '
         writer.comma_first = False
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(writer.write(db))
+        return writer
     
     def generate_report(self, results: Dict, report_file: str = "validation_report.md"):
         """生成验证报告"""
@@ -313,7 +701,10 @@ class BibValidator:
             f.write(f"- 总条目数: {results['total_entries']}\n")
             f.write(f"- 验证通过: {results['valid_entries']}\n")
             f.write(f"- 需要修正: {results['corrected_entries']}\n")
-            f.write(f"- 验证失败: {results['invalid_entries']}\n\n")
+            f.write(f"- 验证失败: {results['invalid_entries']}\n")
+            if results.get('resumed_entries'):
+                f.write(f"- 续跑跳过: {results['resumed_entries']}\n")
+            f.write("\n")
             
             f.write("## 详细结果\n")
             for correction in results['corrections']:
@@ -326,7 +717,7 @@ class BibValidator:
                         f.write(f"  - {key}: {value}\n")
                 f.write("\n")
         
-        logger.info(f"验证报告已生成: {report_file}")
+        logger.info("验证报告已生成: %s", report_file)
 
 def main():
     """主函数"""
@@ -334,19 +725,33 @@ def main():
     parser.add_argument('input', help='输入bib文件路径')
     parser.add_argument('-o', '--output', help='输出bib文件路径')
     parser.add_argument('-p', '--proxy', help='proxy URL (例如: http://127.0.0.1:8080)')
-    parser.add_argument('-d', '--delay', type=float, default=1.0, 
-                       help='请求之间的延迟时间（秒）')
+    parser.add_argument('-d', '--delay', type=float, default=None, 
+                       help=f'请求之间的平均间隔（秒），默认{DEFAULT_DELAY}，提供--mailto时默认{POLITE_DELAY}（Crossref polite pool的50次/秒）')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                       help='并发验证的线程数')
+    parser.add_argument('-b', '--batch-size', type=int, default=50,
+                       help='每批搜索的条目数')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_CACHE_TTL,
+                       help='查询缓存有效期（秒），0表示永不过期')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='禁用查询缓存')
+    parser.add_argument('--mailto', help='联系邮箱，用于Crossref polite pool')
+    parser.add_argument('--resume', action='store_true',
+                       help='从已有输出文件继续，跳过其中已写入的条目')
     parser.add_argument('--report', help='报告文件路径', default='validation_report.md')
     
     args = parser.parse_args()
     
     # 创建验证器
-    validator = BibValidator(proxy_url=args.proxy, delay=args.delay)
+    validator = BibValidator(proxy_url=args.proxy, delay=args.delay, workers=args.workers,
+                             batch_size=args.batch_size,
+                             cache_file=None if args.no_cache else DEFAULT_CACHE_FILE,
+                             cache_ttl=args.cache_ttl, mailto=args.mailto)
     
     try:
         # 处理bib文件
         output_file = args.output or f"corrected_{os.path.basename(args.input)}"
-        results = validator.process_bib_file(args.input, output_file)
+        results = validator.process_bib_file(args.input, output_file, resume=args.resume)
         
         # 生成报告
         validator.generate_report(results, args.report)
@@ -358,12 +763,14 @@ def main():
         print(f"验证通过: {results['valid_entries']}")
         print(f"需要修正: {results['corrected_entries']}")
         print(f"验证失败: {results['invalid_entries']}")
+        if results['resumed_entries']:
+            print(f"续跑跳过: {results['resumed_entries']}")
         print(f"修正文件: {output_file}")
         print(f"报告文件: {args.report}")
         print("="*50)
         
     except Exception as e:
-        logger.error(f"处理失败: {e}")
+        logger.error("处理失败: %s", e)
         return 1
     
     return 0
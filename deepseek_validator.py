@@ -10,27 +10,31 @@ import json
 import time
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-import urllib.parse
-import urllib.request
-import urllib.error
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import bibtexparser
+from rate_limiter import TokenBucket, request_with_backoff
+from log_config import setup_logging
 from bibtexparser.bparser import BibTexParser
 from bibtexparser.bwriter import BibTexWriter
 from bibtexparser.bibdatabase import BibDatabase
 
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('deepseek_validation.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+setup_logging('deepseek_validation.log')
 logger = logging.getLogger(__name__)
 
+# 匹配被包裹在```json代码块中的JSON
+_JSON_BLOCK_RE = re.compile(r'```(?:json)?\s*(.*?)```', re.S)
+
+DEFAULT_BATCH_SIZE = 10
+
+# 每个条目的原始验证、修正后验证和比较三个调用并发发出
+CONCURRENT_CALLS = 3
+
 class DeepSeekValidator:
     def __init__(self, api_key: str, proxy_url: Optional[str] = None, delay: float = 1.0):
         """
@@ -39,24 +43,36 @@ class DeepSeekValidator:
         Args:
             api_key: DeepSeek API密钥
             proxy_url: proxy URL (例如: http://127.0.0.1:10809)
-            delay: 请求之间的延迟时间（秒）
+            delay: 请求之间的平均间隔（秒），即限流速率的倒数
         """
         self.api_key = api_key
         self.delay = delay
+        # 桶容量允许并发的三个调用同时发出，长期速率仍为1/delay
+        self._bucket = TokenBucket(1.0 / delay if delay > 0 else 0, capacity=CONCURRENT_CALLS)
         self.base_url = "https://api.deepseek.com/v1/chat/completions"
         
+        # 复用连接池，避免每次调用重新建立TLS连接
+        self._session = requests.Session()
+        # 适配器只重试连接错误，429由request_with_backoff通过共享令牌桶统一退避
+        adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.3, respect_retry_after_header=False))
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.headers.update({
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.api_key}',
+            'User-Agent': 'BibTeX-Validator/1.0'
+        })
+        
         if proxy_url:
             self._setup_proxy(proxy_url)
     
     def _setup_proxy(self, proxy_url: str):
         """设置proxy"""
-        proxy_handler = urllib.request.ProxyHandler({
+        self._session.proxies = {
             'http': proxy_url,
             'https': proxy_url
-        })
-        opener = urllib.request.build_opener(proxy_handler)
-        urllib.request.install_opener(opener)
-        logger.info(f"已设置proxy: {proxy_url}")
+        }
+        logger.info("已设置proxy: %s", proxy_url)
     
     def query_deepseek(self, prompt: str, max_tokens: int = 1000) -> Optional[str]:
         """
@@ -76,7 +92,7 @@ class DeepSeekValidator:
                 "messages": [
                     {
                         "role": "system",
-                        "content": "你是一个专业的学术引用验证专家。请严格分析BibTeX引用格式，提供准确的验证结果。"
+                        "content": "你是一个专业的学术引用验证专家。请严格分析BibTeX引用格式，提供准确的验证结果，并只返回JSON。"
                     },
                     {
                         "role": "user",
@@ -84,29 +100,23 @@ class DeepSeekValidator:
                     }
                 ],
                 "max_tokens": max_tokens,
-                "temperature": 0.1
+                "temperature": 0.1,
+                "response_format": {"type": "json_object"}
             }
             
-            # 添加延迟避免请求过快
-            time.sleep(self.delay)
-            
-            # 发送请求
-            request = urllib.request.Request(
-                self.base_url,
-                data=json.dumps(data).encode('utf-8'),
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {self.api_key}',
-                    'User-Agent': 'BibTeX-Validator/1.0'
-                }
+            # 发送请求（限流，遇到429时按Retry-After暂停后重试）
+            payload = json.dumps(data).encode('utf-8')
+            response = request_with_backoff(
+                self._bucket,
+                lambda: self._session.post(self.base_url, data=payload, timeout=60),
+                name='DeepSeek'
             )
-            
-            with urllib.request.urlopen(request, timeout=60) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result['choices'][0]['message']['content']
+            response.raise_for_status()
+            result = response.json()
+            return result['choices'][0]['message']['content']
                 
         except Exception as e:
-            logger.error(f"DeepSeek API查询失败: {e}")
+            logger.error("DeepSeek API查询失败: %s", e)
             return None
     
     def validate_bib_format(self, entry: Dict) -> Tuple[bool, str, Dict]:
@@ -120,30 +130,16 @@ class DeepSeekValidator:
             (是否有效, 验证信息, 修正建议)
         """
         entry_id = entry.get('ID', 'unknown')
-        logger.info(f"使用DeepSeek验证条目: {entry_id}")
+        logger.info("使用DeepSeek验证条目: %s", entry_id)
         
         # 构建验证提示词
         prompt = f"""
 请分析以下BibTeX条目的格式正确性：
 
-```bibtex
-@article{{{entry_id},
-  title = {{{entry.get('title', '')}}},
-  author = {{{entry.get('author', '')}}},
-  journal = {{{entry.get('journal', '')}}},
-  year = {{{entry.get('year', '')}}},
-  volume = {{{entry.get('volume', '')}}},
-  number = {{{entry.get('number', '')}}},
-  pages = {{{entry.get('pages', '')}}},
-  doi = {{{entry.get('doi', '')}}}
-}}
-```
+{self._format_entry(entry)}
 
-请按以下格式回复：
-1. 格式正确性：是/否
-2. 主要问题：列出发现的所有格式问题
-3. 修正建议：提供具体的修正建议
-4. 置信度：高/中/低
+请返回JSON对象，格式如下：
+{{"valid": true/false, "issues": "发现的所有格式问题", "corrections": {{"字段名": "修正后的值"}}, "confidence": "高/中/低"}}
 
 请严格分析以下方面：
 - 必填字段是否完整（title, author, journal, year）
@@ -161,42 +157,121 @@ class DeepSeekValidator:
             return False, "DeepSeek API调用失败", {}
         
         # 解析响应
-        is_valid = "格式正确性：是" in response
-        corrections = self._parse_corrections(response)
+        verdict = self._parse_json(response)
+        is_valid = bool(verdict.get('valid'))
+        corrections = self._parse_corrections(verdict)
+        
+        return is_valid, self._format_verdict(verdict, response), corrections
+    
+    def validate_bib_formats(self, entries: List[Dict]) -> List[Tuple[bool, str, Dict]]:
+        """
+        在一次DeepSeek调用中批量验证多个BibTeX条目的格式
+        
+        Args:
+            entries: bib条目字典列表
+            
+        Returns:
+            与entries顺序一致的(是否有效, 验证信息, 修正建议)列表
+        """
+        if not entries:
+            return []
+        if len(entries) == 1:
+            return [self.validate_bib_format(entries[0])]
+        
+        logger.info("使用DeepSeek批量验证 %s 个条目", len(entries))
+        
+        entries_text = '\n\n'.join(f"条目 {i + 1}：\n{self._format_entry(entry)}"
+                                    for i, entry in enumerate(entries))
+        prompt = f"""
+请分析以下 {len(entries)} 个BibTeX条目的格式正确性：
+
+{entries_text}
+
+请返回JSON对象，其中results数组按条目顺序每个条目对应一个对象，格式如下：
+{{"results": [{{"id": "条目ID", "valid": true/false, "issues": "发现的所有格式问题", "corrections": {{"字段名": "修正后的值"}}, "confidence": "高/中/低"}}]}}
+
+请严格分析以下方面：
+- 必填字段是否完整（title, author, journal, year）
+- 作者格式是否正确（使用"and"分隔）
+- 期刊名称格式
+- 年份格式（4位数字）
+- 卷号格式（数字）
+- 页码格式（正确使用连字符）
+- DOI格式（以10.开头）
+- 特殊字符转义
+        """
+        
+        response = self.query_deepseek(prompt, max_tokens=min(8000, 300 * len(entries) + 200))
+        verdicts = self._parse_batch_verdicts(response, entries) if response else {}
+        
+        results = []
+        for entry in entries:
+            verdict = verdicts.get(entry.get('ID', 'unknown'))
+            if verdict is None:
+                # 批量结果中缺失或无法解析的条目回退到单条验证
+                results.append(self.validate_bib_format(entry))
+                continue
+            
+            results.append((bool(verdict.get('valid')), self._format_verdict(verdict),
+                            self._parse_corrections(verdict)))
+        
+        return results
+    
+    def _parse_batch_verdicts(self, response: str, entries: List[Dict]) -> Dict[str, Dict]:
+        """解析批量验证返回的JSON，返回条目ID到验证结果的映射"""
+        verdicts = self._parse_json(response).get('results')
+        if not isinstance(verdicts, list):
+            return {}
         
-        return is_valid, response, corrections
+        parsed = {}
+        for i, verdict in enumerate(verdicts):
+            if not isinstance(verdict, dict):
+                continue
+            # 优先按返回的ID对应，缺失时按位置对应
+            entry_id = verdict.get('id')
+            if entry_id is None and i < len(entries):
+                entry_id = entries[i].get('ID', 'unknown')
+            parsed[str(entry_id)] = verdict
+        
+        return parsed
+    
+    def _format_entry(self, entry: Dict) -> str:
+        """将条目格式化为提示词中使用的BibTeX代码块"""
+        return f"""```bibtex
+@article{{{entry.get('ID', 'unknown')},
+  title = {{{entry.get('title', '')}}},
+  author = {{{entry.get('author', '')}}},
+  journal = {{{entry.get('journal', '')}}},
+  year = {{{entry.get('year', '')}}},
+  volume = {{{entry.get('volume', '')}}},
+  number = {{{entry.get('number', '')}}},
+  pages = {{{entry.get('pages', '')}}},
+  doi = {{{entry.get('doi', '')}}}
+}}
+```"""
     
-    def _parse_corrections(self, response: str) -> Dict:
-        """解析DeepSeek的修正建议"""
-        corrections = {}
-        
-        # 简单的关键词匹配来提取修正建议
-        lines = response.split('\n')
-        for line in lines:
-            line = line.strip()
-            if '标题' in line.lower() and '建议' in line.lower():
-                if ':' in line:
-                    corrections['title'] = line.split(':', 1)[1].strip()
-            elif '作者' in line.lower() and '建议' in line.lower():
-                if ':' in line:
-                    corrections['author'] = line.split(':', 1)[1].strip()
-            elif '期刊' in line.lower() and '建议' in line.lower():
-                if ':' in line:
-                    corrections['journal'] = line.split(':', 1)[1].strip()
-            elif '年份' in line.lower() and '建议' in line.lower():
-                if ':' in line:
-                    corrections['year'] = line.split(':', 1)[1].strip()
-            elif '卷号' in line.lower() and '建议' in line.lower():
-                if ':' in line:
-                    corrections['volume'] = line.split(':', 1)[1].strip()
-            elif '页码' in line.lower() and '建议' in line.lower():
-                if ':' in line:
-                    corrections['pages'] = line.split(':', 1)[1].strip()
-            elif 'doi' in line.lower() and '建议' in line.lower():
-                if ':' in line:
-                    corrections['doi'] = line.split(':', 1)[1].strip()
-        
-        return corrections
+    def _parse_json(self, response: str) -> Dict:
+        """解析DeepSeek返回的JSON对象（兼容被包裹在代码块中的情况），失败时返回空字典"""
+        match = _JSON_BLOCK_RE.search(response)
+        try:
+            result = json.loads(match.group(1) if match else response)
+        except ValueError as e:
+            logger.warning("DeepSeek响应JSON解析失败: %s", e)
+            return {}
+        return result if isinstance(result, dict) else {}
+    
+    def _format_verdict(self, verdict: Dict, fallback: str = '') -> str:
+        """将格式验证结果转换为报告中使用的文本"""
+        if not verdict:
+            return fallback
+        return (f"格式正确性：{'是' if verdict.get('valid') else '否'}\n"
+                f"主要问题：{verdict.get('issues', '')}\n"
+                f"置信度：{verdict.get('confidence', '')}")
+    
+    def _parse_corrections(self, verdict: Dict) -> Dict:
+        """从验证结果中提取DeepSeek的修正建议"""
+        corrections = verdict.get('corrections') or {}
+        return corrections if isinstance(corrections, dict) else {}
     
     def compare_entries(self, original: Dict, corrected: Dict) -> Tuple[bool, str, Dict]:
         """
@@ -210,45 +285,20 @@ class DeepSeekValidator:
             (是否改进, 比较结果, 改进详情)
         """
         entry_id = original.get('ID', 'unknown')
-        logger.info(f"比较条目改进: {entry_id}")
+        logger.info("比较条目改进: %s", entry_id)
         
         # 构建比较提示词
         prompt = f"""
 请比较以下两个BibTeX条目，判断修正后的版本是否比原始版本更好：
 
 原始版本：
-```bibtex
-@article{{{entry_id},
-  title = {{{original.get('title', '')}}},
-  author = {{{original.get('author', '')}}},
-  journal = {{{original.get('journal', '')}}},
-  year = {{{original.get('year', '')}}},
-  volume = {{{original.get('volume', '')}}},
-  number = {{{original.get('number', '')}}},
-  pages = {{{original.get('pages', '')}}},
-  doi = {{{original.get('doi', '')}}}
-}}
-```
+{self._format_entry(original)}
 
 修正后版本：
-```bibtex
-@article{{{entry_id},
-  title = {{{corrected.get('title', '')}}},
-  author = {{{corrected.get('author', '')}}},
-  journal = {{{corrected.get('journal', '')}}},
-  year = {{{corrected.get('year', '')}}},
-  volume = {{{corrected.get('volume', '')}}},
-  number = {{{corrected.get('number', '')}}},
-  pages = {{{corrected.get('pages', '')}}},
-  doi = {{{corrected.get('doi', '')}}}
-}}
-```
+{self._format_entry(corrected)}
 
-请按以下格式回复：
-1. 是否改进：是/否
-2. 改进方面：列出具体改进的方面
-3. 改进程度：显著/中等/轻微
-4. 建议：进一步的改进建议
+请返回JSON对象，格式如下：
+{{"improved": true/false, "aspects": "具体改进的方面", "level": "显著/中等/轻微", "suggestions": "进一步的改进建议"}}
         """
         
         response = self.query_deepseek(prompt)
@@ -256,36 +306,34 @@ class DeepSeekValidator:
             return False, "DeepSeek API调用失败", {}
         
         # 解析响应
-        is_improved = "是否改进：是" in response
-        improvements = self._parse_improvements(response)
+        result = self._parse_json(response)
+        is_improved = bool(result.get('improved'))
+        improvements = self._parse_improvements(result)
+        if not improvements:
+            return is_improved, response, improvements
         
-        return is_improved, response, improvements
+        comparison = (f"是否改进：{'是' if is_improved else '否'}\n"
+                      f"改进方面：{improvements.get('aspects', '')}\n"
+                      f"改进程度：{improvements.get('level', '')}\n"
+                      f"建议：{improvements.get('suggestions', '')}")
+        return is_improved, comparison, improvements
     
-    def _parse_improvements(self, response: str) -> Dict:
-        """解析改进详情"""
-        improvements = {}
-        
-        lines = response.split('\n')
-        for line in lines:
-            line = line.strip()
-            if '改进方面' in line and ':' in line:
-                improvements['aspects'] = line.split(':', 1)[1].strip()
-            elif '改进程度' in line and ':' in line:
-                improvements['level'] = line.split(':', 1)[1].strip()
-            elif '建议' in line and ':' in line:
-                improvements['suggestions'] = line.split(':', 1)[1].strip()
-        
-        return improvements
+    def _parse_improvements(self, result: Dict) -> Dict:
+        """从比较结果中提取改进详情"""
+        return {key: result[key] for key in ('aspects', 'level', 'suggestions') if key in result}
 
 class EnhancedBibValidator:
-    def __init__(self, deepseek_api_key: Optional[str] = None, proxy_url: Optional[str] = None):
+    def __init__(self, deepseek_api_key: Optional[str] = None, proxy_url: Optional[str] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
         """
         增强版BibTeX验证器
         
         Args:
             deepseek_api_key: DeepSeek API密钥（可选）
             proxy_url: proxy URL
+            batch_size: 每次DeepSeek调用中验证的条目数
         """
+        self.batch_size = max(1, batch_size)
         self.deepseek_validator = None
         if deepseek_api_key:
             self.deepseek_validator = DeepSeekValidator(deepseek_api_key, proxy_url)
@@ -305,24 +353,18 @@ class EnhancedBibValidator:
             logger.error("未提供DeepSeek API密钥")
             return
         
-        # 读取原始文件
-        with open(original_file, 'r', encoding='utf-8') as f:
-            original_content = f.read()
-        
-        # 读取修正后文件
-        with open(corrected_file, 'r', encoding='utf-8') as f:
-            corrected_content = f.read()
-        
-        # 解析bib文件
+        # 解析bib文件（直接从文件对象读取）
         parser = BibTexParser()
         parser.ignore_nonstandard_types = False
         
-        try:
-            original_db = bibtexparser.loads(original_content, parser=parser)
-            corrected_db = bibtexparser.loads(corrected_content, parser=parser)
-        except Exception as e:
-            logger.error(f"解析bib文件失败: {e}")
-            return
+        with open(original_file, 'r', encoding='utf-8') as original_f, \
+                open(corrected_file, 'r', encoding='utf-8') as corrected_f:
+            try:
+                original_db = bibtexparser.load(original_f, parser=parser)
+                corrected_db = bibtexparser.load(corrected_f, parser=parser)
+            except Exception as e:
+                logger.error("解析bib文件失败: %s", e)
+                return
         
         results = {
             'total_entries': len(original_db.entries),
@@ -331,17 +373,35 @@ class EnhancedBibValidator:
             'comparison_results': []
         }
         
-        # 验证每个条目
-        for orig_entry, corr_entry in zip(original_db.entries, corrected_db.entries):
+        # 批量格式验证：每次调用验证batch_size个条目
+        entry_count = min(len(original_db.entries), len(corrected_db.entries))
+        orig_entries = original_db.entries[:entry_count]
+        corr_entries = corrected_db.entries[:entry_count]
+        orig_formats = []
+        corr_formats = []
+        comparisons = []
+        
+        # 原始验证、修正后验证和比较互不依赖，并发发出
+        with ThreadPoolExecutor(max_workers=CONCURRENT_CALLS) as executor:
+            for start in range(0, len(orig_entries), self.batch_size):
+                end = start + self.batch_size
+                orig_future = executor.submit(self.deepseek_validator.validate_bib_formats, orig_entries[start:end])
+                corr_future = executor.submit(self.deepseek_validator.validate_bib_formats, corr_entries[start:end])
+                compare_futures = [executor.submit(self.deepseek_validator.compare_entries, orig_entry, corr_entry)
+                                   for orig_entry, corr_entry in zip(orig_entries[start:end], corr_entries[start:end])]
+                orig_formats.extend(orig_future.result())
+                corr_formats.extend(corr_future.result())
+                comparisons.extend(future.result() for future in compare_futures)
+        
+        # 汇总每个条目的结果
+        for orig_entry, orig_format, corr_format, comparison_result in zip(orig_entries, orig_formats,
+                                                                           corr_formats, comparisons):
             entry_id = orig_entry.get('ID', 'unknown')
-            logger.info(f"深度验证条目: {entry_id}")
-            
-            # 格式验证
-            orig_valid, orig_validation, orig_corrections = self.deepseek_validator.validate_bib_format(orig_entry)
-            corr_valid, corr_validation, corr_corrections = self.deepseek_validator.validate_bib_format(corr_entry)
+            logger.info("深度验证条目: %s", entry_id)
             
-            # 比较改进
-            is_improved, comparison, improvements = self.deepseek_validator.compare_entries(orig_entry, corr_entry)
+            orig_valid, orig_validation, orig_corrections = orig_format
+            corr_valid, corr_validation, corr_corrections = corr_format
+            is_improved, comparison, improvements = comparison_result
             
             results['comparison_results'].append({
                 'id': entry_id,
@@ -370,8 +430,9 @@ class EnhancedBibValidator:
         # 生成报告
         self._generate_deepseek_report(results, output_file)
         
-        logger.info(f"DeepSeek验证完成！格式验证通过: {results['format_validated']}/{results['total_entries']}, "
-                   f"改进确认: {results['format_improved']}/{results['total_entries']}")
+        logger.info("DeepSeek验证完成！格式验证通过: %s/%s, 改进确认: %s/%s",
+                   results['format_validated'], results['total_entries'],
+                   results['format_improved'], results['total_entries'])
     
     def _generate_deepseek_report(self, results: Dict, output_file: str):
         """生成DeepSeek验证报告"""
@@ -411,11 +472,14 @@ def main():
     parser.add_argument('-o', '--output', help='输出报告文件路径', default='deepseek_validation_report.md')
     parser.add_argument('--api-key', help='DeepSeek API密钥', required=True)
     parser.add_argument('-p', '--proxy', help='proxy URL (例如: http://127.0.0.1:10809)')
+    parser.add_argument('-b', '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                       help='每次DeepSeek调用中验证的条目数')
     
     args = parser.parse_args()
     
     # 创建验证器
-    validator = EnhancedBibValidator(deepseek_api_key=args.api_key, proxy_url=args.proxy)
+    validator = EnhancedBibValidator(deepseek_api_key=args.api_key, proxy_url=args.proxy,
+                                     batch_size=args.batch_size)
     
     try:
         # 进行深度验证
@@ -423,7 +487,7 @@ def main():
         print(f"DeepSeek验证报告已生成: {args.output}")
         
     except Exception as e:
-        logger.error(f"DeepSeek验证失败: {e}")
+        logger.error("DeepSeek验证失败: %s", e)
         return 1
     
     return 0
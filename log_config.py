@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+日志配置工具
+日志记录先进入队列，由后台监听线程写入文件和控制台，工作线程不会阻塞在磁盘I/O上
+"""
+
+import queue
+import atexit
+import logging
+import logging.handlers
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+def setup_logging(log_file: str, level: int = logging.INFO):
+    """
+    为根日志记录器配置队列日志（根日志记录器已配置时不做任何操作）
+    
+    Args:
+        log_file: 日志文件路径
+        level: 日志级别
+    """
+    root_logger = logging.getLogger()
+    if root_logger.handlers:
+        return
+    
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [
+        logging.FileHandler(log_file, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    root_logger.setLevel(level)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    # 退出前把队列中剩余的日志写完
+    atexit.register(listener.stop)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+请求速率限制工具
+为Crossref、DeepSeek等外部API提供令牌桶限流
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        初始化令牌桶
+        
+        Args:
+            rate: 每秒补充的令牌数（即允许的请求速率），<=0表示不限速
+            capacity: 桶容量（允许的突发请求数），默认与rate相同且至少为1
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """获取一个令牌，必要时阻塞等待（线程安全）"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                    self._last = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+    
+    def pause(self, seconds: float):
+        """
+        服务端要求退避时（如HTTP 429的Retry-After）暂停发放令牌
+        
+        Args:
+            seconds: 暂停时间（秒）
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self._last = self._paused_until
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """解析Retry-After响应头（秒数），无法解析时返回默认值"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+def request_with_backoff(bucket: TokenBucket, send: Callable[[], requests.Response],
+                         name: str = 'API', max_attempts: int = 3) -> requests.Response:
+    """
+    限流后发送请求，遇到HTTP 429时按Retry-After暂停令牌桶再重试
+    
+    Args:
+        bucket: 所有线程共享的令牌桶
+        send: 发送一次请求并返回响应的函数
+        name: 服务名称，用于日志
+        max_attempts: 最大尝试次数
+        
+    Returns:
+        最后一次请求的响应（调用方自行检查状态码）
+    """
+    for _ in range(max_attempts):
+        bucket.acquire()
+        response = send()
+        if response.status_code != 429:
+            break
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        logger.warning("%s请求过快，暂停 %s 秒", name, retry_after)
+        bucket.pause(retry_after)
+    return response